@@ -3,19 +3,28 @@ COMPLETE STUDENT ATTENDANCE & PROGRESS TRACKER
 Student, Teacher, Parent Login & Management System
 """
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, session
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, case, event, bindparam
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import joinedload, raiseload
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, timedelta
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from datetime import date, datetime, timedelta
+from functools import wraps
+from cachetools import TTLCache
+import hashlib
 import os
+import threading
 
 # Load configuration
-from config import DevelopmentConfig
+from config import config_by_name
 
-# Initialize Flask
+# Initialize Flask (set APP_CONFIG=development for debug mode and lazy-load checks)
 app = Flask(__name__)
-app.config.from_object(DevelopmentConfig)
+app.config.from_object(config_by_name[os.environ.get('APP_CONFIG', 'production')])
 
 # Initialize Database
 db = SQLAlchemy(app)
@@ -25,6 +34,15 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# Password check cache - (user id, stored hash, keyed digest) -> result
+# Only a keyed blake2b digest of the password is kept in memory
+# TTLCache is not thread-safe, so every access goes through _pw_cache_lock
+_pw_cache = TTLCache(maxsize=10000, ttl=300)
+_pw_cache_lock = threading.Lock()
+
+# Argon2id for new hashes; legacy pbkdf2 hashes are still accepted and upgraded on login
+ph = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
 # ==================== DATABASE MODELS ====================
 
 class User(UserMixin, db.Model):
@@ -37,15 +55,52 @@ class User(UserMixin, db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    student = db.relationship('Student', backref='user', uselist=False)
-    teacher = db.relationship('Teacher', backref='user', uselist=False)
-    parent = db.relationship('Parent', backref='user', uselist=False)
+    __table_args__ = (
+        db.Index('ix_user_role', 'role'),
+    )
+    
+    student = db.relationship('Student', back_populates='user', uselist=False)
+    teacher = db.relationship('Teacher', back_populates='user', uselist=False)
+    parent = db.relationship('Parent', back_populates='user', uselist=False)
+    
+    @property
+    def profile_id(self):
+        profile = getattr(self, self.role) if self.role in ROLE_DASHBOARD else None
+        return profile.id if profile else None
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
+        # Old cache entries are keyed on the previous hash and simply expire
+        self.password_hash = ph.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        digest = hashlib.blake2b(
+            password.encode(),
+            digest_size=16,
+            key=app.config['SECRET_KEY'].encode()[:64]
+        ).hexdigest()
+        key = (self.id, self.password_hash, digest)
+        
+        with _pw_cache_lock:
+            result = _pw_cache.get(key)
+        if result is None:
+            result = self._verify_password(password)
+            with _pw_cache_lock:
+                _pw_cache[key] = result
+        return result
+    
+    def _verify_password(self, password):
+        if not self.password_hash.startswith('$argon2'):
+            return check_password_hash(self.password_hash, password)
+        
+        try:
+            return ph.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    
+    def password_needs_rehash(self):
+        if not self.password_hash.startswith('$argon2'):
+            return True
+        return ph.check_needs_rehash(self.password_hash)
 
 class Student(db.Model):
     """Student Details"""
@@ -56,9 +111,11 @@ class Student(db.Model):
     class_name = db.Column(db.String(50), nullable=False)
     phone = db.Column(db.String(15), nullable=False)
     
+    user = db.relationship('User', back_populates='student')
     attendances = db.relationship('Attendance', backref='student', lazy=True, cascade='all, delete-orphan')
     progress_records = db.relationship('Progress', backref='student', lazy=True, cascade='all, delete-orphan')
     parent_id = db.Column(db.Integer, db.ForeignKey('parent.id'))
+    parent_user = db.relationship('Parent', back_populates='students')
 
 class Teacher(db.Model):
     """Teacher Details"""
@@ -69,6 +126,7 @@ class Teacher(db.Model):
     subject = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(15), nullable=False)
     
+    user = db.relationship('User', back_populates='teacher')
     attendances = db.relationship('Attendance', backref='teacher', lazy=True, cascade='all, delete-orphan')
     progress_records = db.relationship('Progress', backref='teacher', lazy=True, cascade='all, delete-orphan')
 
@@ -80,7 +138,8 @@ class Parent(db.Model):
     phone_number = db.Column(db.String(15), nullable=False)
     email = db.Column(db.String(120), nullable=False)
     
-    students = db.relationship('Student', backref='parent_user', lazy=True)
+    user = db.relationship('User', back_populates='parent')
+    students = db.relationship('Student', back_populates='parent_user', lazy='selectin')
 
 class Attendance(db.Model):
     """Attendance Records"""
@@ -91,6 +150,11 @@ class Attendance(db.Model):
     present = db.Column(db.Boolean, default=False)
     remarks = db.Column(db.String(500))
     marked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_att_student_date', 'student_id', 'date'),
+        db.Index('ix_att_teacher_date', 'teacher_id', 'date'),
+    )
 
 class Progress(db.Model):
     """Student Progress"""
@@ -101,68 +165,140 @@ class Progress(db.Model):
     assignment_name = db.Column(db.String(200), nullable=False)
     marks_obtained = db.Column(db.Float, nullable=False)
     total_marks = db.Column(db.Float, default=100.0)
-    percentage = db.Column(db.Float)
+    percentage = db.Column(db.Float, db.Computed(
+        '(marks_obtained * 100.0) / NULLIF(total_marks, 0)', persisted=True
+    ))
     date = db.Column(db.Date, nullable=False)
     comments = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    def calculate_percentage(self):
-        if self.total_marks > 0:
-            self.percentage = (self.marks_obtained / self.total_marks) * 100
+    __table_args__ = (
+        db.Index('ix_prog_student_date', 'student_id', 'date'),
+        db.Index('ix_prog_student_subject', 'student_id', 'subject'),
+    )
+
+# ==================== PREBUILT QUERIES ====================
+# Built once at import and executed with bound parameters on hot paths
+
+ATTENDANCE_SUMMARY_STMT = db.select(
+    func.count(Attendance.id).label('total'),
+    func.coalesce(func.sum(case((Attendance.present == True, 1), else_=0)), 0).label('present')
+).where(
+    Attendance.student_id == bindparam('student_id'),
+    Attendance.date >= bindparam('from_date')
+)
+
+ATTENDANCE_CHART_STMT = db.select(Attendance.date, Attendance.present).where(
+    Attendance.student_id == bindparam('student_id'),
+    Attendance.date >= bindparam('from_date')
+).order_by(Attendance.date)
+
+PROGRESS_CHART_STMT = db.select(Progress.assignment_name, Progress.percentage).where(
+    Progress.student_id == bindparam('student_id')
+).order_by(Progress.date).limit(10)
 
 # ==================== LOGIN FUNCTIONS ====================
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Profiles are one-to-one, so join them into the same SELECT
+    user = db.session.get(User, int(user_id), options=maybe_raiseload([
+        joinedload(User.student),
+        joinedload(User.teacher),
+        joinedload(User.parent).selectinload(Parent.students)
+    ]))
+    if user is None:
+        # Account deleted - drop the session and remember-me cookie, like logout_user()
+        session.clear()
+        session['_remember'] = 'clear'
+    return user
 
 # ==================== HELPER FUNCTIONS ====================
 
-def get_attendance_percentage(student_id, days=30):
-    from_date = datetime.now().date() - timedelta(days=days)
-    
-    total = Attendance.query.filter(
-        Attendance.student_id == student_id,
-        Attendance.date >= from_date
-    ).count()
-    
-    if total == 0:
+def maybe_raiseload(options):
+    # In development, make any lazy load not covered by eager options fail loudly
+    if app.config.get('RAISE_ON_LAZY_LOAD'):
+        return options + [raiseload('*', sql_only=True)]
+    return options
+
+ROLE_DASHBOARD = {
+    'student': 'student_dashboard',
+    'teacher': 'teacher_dashboard',
+    'parent': 'parent_dashboard'
+}
+
+def role_required(role):
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if current_user.role != role:
+                flash('❌ Unauthorized', 'error')
+                return redirect(url_for('login'))
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def get_attendance_percentage(student_id, days=30, from_date=None):
+    if from_date is None:
+        from_date = date.today() - timedelta(days=days)
+    
+    row = db.session.execute(
+        ATTENDANCE_SUMMARY_STMT,
+        {'student_id': student_id, 'from_date': from_date}
+    ).one()
+    
+    if row.total == 0:
         return 0
     
-    present = Attendance.query.filter(
-        Attendance.student_id == student_id,
-        Attendance.date >= from_date,
-        Attendance.present == True
-    ).count()
-    
-    return (present / total) * 100
+    return (float(row.present) / row.total) * 100
 
 def get_average_marks(student_id, subject=None):
-    query = Progress.query.filter(Progress.student_id == student_id)
+    query = db.session.query(func.avg(Progress.percentage)).filter(
+        Progress.student_id == student_id
+    )
     
     if subject:
         query = query.filter(Progress.subject == subject)
     
-    records = query.all()
+    return query.scalar() or 0
+
+def get_attendance_percentages(student_ids, days=30, from_date=None):
+    if not student_ids:
+        return {}
     
-    if not records:
-        return 0
+    if from_date is None:
+        from_date = date.today() - timedelta(days=days)
+    
+    rows = db.session.query(
+        Attendance.student_id,
+        func.sum(case((Attendance.present == True, 1), else_=0)) * 100.0 / func.count(Attendance.id)
+    ).filter(
+        Attendance.student_id.in_(student_ids),
+        Attendance.date >= from_date
+    ).group_by(Attendance.student_id).all()
+    
+    return dict(rows)
+
+def get_average_marks_map(student_ids):
+    if not student_ids:
+        return {}
+    
+    rows = db.session.query(
+        Progress.student_id,
+        func.avg(Progress.percentage)
+    ).filter(
+        Progress.student_id.in_(student_ids)
+    ).group_by(Progress.student_id).all()
     
-    total = sum(record.percentage for record in records)
-    return total / len(records)
+    return {student_id: avg or 0 for student_id, avg in rows}
 
 # ==================== ROUTES ====================
 
 # Login & Register
 @app.route('/', methods=['GET', 'POST'])
 def login():
-    if current_user.is_authenticated:
-        if current_user.role == 'student':
-            return redirect(url_for('student_dashboard'))
-        elif current_user.role == 'teacher':
-            return redirect(url_for('teacher_dashboard'))
-        elif current_user.role == 'parent':
-            return redirect(url_for('parent_dashboard'))
+    if current_user.is_authenticated and current_user.role in ROLE_DASHBOARD:
+        return redirect(url_for(ROLE_DASHBOARD[current_user.role]))
     
     if request.method == 'POST':
         username = request.form.get('username')
@@ -171,14 +307,14 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password):
+            if user.password_needs_rehash():
+                user.set_password(password)
+                db.session.commit()
+            
             login_user(user, remember=True)
             
-            if user.role == 'student':
-                return redirect(url_for('student_dashboard'))
-            elif user.role == 'teacher':
-                return redirect(url_for('teacher_dashboard'))
-            elif user.role == 'parent':
-                return redirect(url_for('parent_dashboard'))
+            if user.role in ROLE_DASHBOARD:
+                return redirect(url_for(ROLE_DASHBOARD[user.role]))
         else:
             flash('❌ Invalid username or password', 'error')
     
@@ -192,12 +328,15 @@ def register():
         password = request.form.get('password')
         role = request.form.get('role')
         
-        if User.query.filter_by(username=username).first():
-            flash('❌ Username already exists', 'error')
-            return redirect(url_for('register'))
+        existing = db.session.query(User.username, User.email).filter(
+            db.or_(User.username == username, User.email == email)
+        ).order_by((User.username == username).desc()).first()
         
-        if User.query.filter_by(email=email).first():
-            flash('❌ Email already registered', 'error')
+        if existing:
+            if existing.username == username:
+                flash('❌ Username already exists', 'error')
+            else:
+                flash('❌ Email already registered', 'error')
             return redirect(url_for('register'))
         
         user = User(username=username, email=email, role=role)
@@ -221,19 +360,17 @@ def logout():
 # Student Routes
 @app.route('/student/dashboard')
 @login_required
+@role_required('student')
 def student_dashboard():
-    if current_user.role != 'student':
-        flash('❌ Unauthorized', 'error')
-        return redirect(url_for('login'))
-    
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student = current_user.student
     
     if not student:
         flash('❌ Student profile not found', 'error')
         return redirect(url_for('logout'))
     
-    attendance_30 = get_attendance_percentage(student.id, days=30)
-    attendance_60 = get_attendance_percentage(student.id, days=60)
+    today = date.today()
+    attendance_30 = get_attendance_percentage(student.id, from_date=today - timedelta(days=30))
+    attendance_60 = get_attendance_percentage(student.id, from_date=today - timedelta(days=60))
     
     recent_attendance = Attendance.query.filter_by(student_id=student.id).order_by(
         Attendance.date.desc()
@@ -253,48 +390,44 @@ def student_dashboard():
 # Parent Routes
 @app.route('/parent/dashboard')
 @login_required
+@role_required('parent')
 def parent_dashboard():
-    if current_user.role != 'parent':
-        flash('❌ Unauthorized', 'error')
-        return redirect(url_for('login'))
-    
-    parent = Parent.query.filter_by(user_id=current_user.id).first()
+    # Loaded by load_user together with Parent.students
+    parent = current_user.parent
     
     if not parent:
         flash('❌ Parent profile not found', 'error')
         return redirect(url_for('logout'))
     
     students = parent.students
+    student_ids = [student.id for student in students]
+    
+    attendance_map = get_attendance_percentages(student_ids)
+    avg_marks_map = get_average_marks_map(student_ids)
     
     student_data = []
     for student in students:
-        attendance = get_attendance_percentage(student.id)
-        avg_marks = get_average_marks(student.id)
-        
         student_data.append({
             'student': student,
-            'attendance': attendance,
-            'avg_marks': avg_marks
+            'attendance': attendance_map.get(student.id, 0),
+            'avg_marks': avg_marks_map.get(student.id, 0)
         })
     
     return render_template('parent_dashboard.html', student_data=student_data)
 
 @app.route('/parent/view-student/<int:student_id>')
 @login_required
+@role_required('parent')
 def parent_view_student(student_id):
-    if current_user.role != 'parent':
-        flash('❌ Unauthorized', 'error')
-        return redirect(url_for('login'))
-    
-    student = Student.query.get(student_id)
+    student = db.session.get(Student, student_id)
     
     if not student:
         flash('❌ Student not found', 'error')
         return redirect(url_for('parent_dashboard'))
     
-    parent = Parent.query.filter_by(user_id=current_user.id).first()
+    parent_id = current_user.profile_id
     
-    if student.parent_id != parent.id:
+    if parent_id is None or student.parent_id != parent_id:
         flash('❌ Access denied', 'error')
         return redirect(url_for('parent_dashboard'))
     
@@ -304,7 +437,7 @@ def parent_view_student(student_id):
     
     progress_records = Progress.query.filter_by(student_id=student_id).order_by(
         Progress.date.desc()
-    ).all()
+    ).limit(50).all()
     
     attendance_percentage = get_attendance_percentage(student_id)
     average_marks = get_average_marks(student_id)
@@ -319,12 +452,9 @@ def parent_view_student(student_id):
 # Teacher Routes
 @app.route('/teacher/dashboard')
 @login_required
+@role_required('teacher')
 def teacher_dashboard():
-    if current_user.role != 'teacher':
-        flash('❌ Unauthorized', 'error')
-        return redirect(url_for('login'))
-    
-    teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+    teacher = current_user.teacher
     
     if not teacher:
         flash('❌ Teacher profile not found', 'error')
@@ -338,40 +468,49 @@ def teacher_dashboard():
 
 @app.route('/teacher/mark-attendance', methods=['GET', 'POST'])
 @login_required
+@role_required('teacher')
 def mark_attendance():
-    if current_user.role != 'teacher':
-        flash('❌ Unauthorized', 'error')
-        return redirect(url_for('login'))
-    
-    teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+    teacher = current_user.teacher
     students = Student.query.filter_by(class_name=teacher.department).all()
     
     if request.method == 'POST':
         date_str = request.form.get('date')
         attendance_date = datetime.strptime(date_str, '%Y-%m-%d').date()
         
+        existing = {
+            record.student_id: record.id
+            for record in Attendance.query.filter(
+                Attendance.teacher_id == teacher.id,
+                Attendance.date == attendance_date,
+                Attendance.student_id.in_([student.id for student in students])
+            ).all()
+        }
+        
+        to_insert = []
+        to_update = []
         for student in students:
             present = request.form.get(f'attendance_{student.id}') == 'on'
             remarks = request.form.get(f'remarks_{student.id}', '')
             
-            existing = Attendance.query.filter_by(
-                student_id=student.id,
-                teacher_id=teacher.id,
-                date=attendance_date
-            ).first()
-            
-            if existing:
-                existing.present = present
-                existing.remarks = remarks
+            if student.id in existing:
+                to_update.append({
+                    'id': existing[student.id],
+                    'present': present,
+                    'remarks': remarks
+                })
             else:
-                attendance = Attendance(
-                    student_id=student.id,
-                    teacher_id=teacher.id,
-                    date=attendance_date,
-                    present=present,
-                    remarks=remarks
-                )
-                db.session.add(attendance)
+                to_insert.append({
+                    'student_id': student.id,
+                    'teacher_id': teacher.id,
+                    'date': attendance_date,
+                    'present': present,
+                    'remarks': remarks
+                })
+        
+        if to_insert:
+            db.session.bulk_insert_mappings(Attendance, to_insert)
+        if to_update:
+            db.session.bulk_update_mappings(Attendance, to_update)
         
         db.session.commit()
         flash('✅ Attendance marked!', 'success')
@@ -381,12 +520,9 @@ def mark_attendance():
 
 @app.route('/teacher/update-progress', methods=['GET', 'POST'])
 @login_required
+@role_required('teacher')
 def update_progress():
-    if current_user.role != 'teacher':
-        flash('❌ Unauthorized', 'error')
-        return redirect(url_for('login'))
-    
-    teacher = Teacher.query.filter_by(user_id=current_user.id).first()
+    teacher = current_user.teacher
     students = Student.query.filter_by(class_name=teacher.department).all()
     
     if request.method == 'POST':
@@ -408,7 +544,6 @@ def update_progress():
             date=progress_date,
             comments=comments
         )
-        progress.calculate_percentage()
         
         db.session.add(progress)
         db.session.commit()
@@ -420,18 +555,25 @@ def update_progress():
 
 @app.route('/teacher/reports')
 @login_required
+@role_required('teacher')
 def reports():
-    if current_user.role != 'teacher':
-        flash('❌ Unauthorized', 'error')
-        return redirect(url_for('login'))
+    teacher = current_user.teacher
+    # Only the columns the report shows - no Student objects in the identity map
+    students = db.session.execute(
+        db.select(Student.id, Student.roll_number, Student.full_name).where(
+            Student.class_name == teacher.department
+        )
+    ).all()
     
-    teacher = Teacher.query.filter_by(user_id=current_user.id).first()
-    students = Student.query.filter_by(class_name=teacher.department).all()
+    student_ids = [student.id for student in students]
+    
+    attendance_map = get_attendance_percentages(student_ids)
+    avg_marks_map = get_average_marks_map(student_ids)
     
     report_data = []
     for student in students:
-        attendance = get_attendance_percentage(student.id)
-        avg_marks = get_average_marks(student.id)
+        attendance = attendance_map.get(student.id, 0)
+        avg_marks = avg_marks_map.get(student.id, 0)
         
         report_data.append({
             'student': student,
@@ -448,16 +590,16 @@ def attendance_chart_data():
     if current_user.role != 'student':
         return jsonify({'error': 'Unauthorized'}), 401
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student_id = current_user.profile_id
     
-    from_date = datetime.now().date() - timedelta(days=30)
-    records = Attendance.query.filter(
-        Attendance.student_id == student.id,
-        Attendance.date >= from_date
-    ).order_by(Attendance.date).all()
+    from_date = date.today() - timedelta(days=30)
+    rows = db.session.execute(
+        ATTENDANCE_CHART_STMT,
+        {'student_id': student_id, 'from_date': from_date}
+    ).all()
     
-    labels = [r.date.strftime('%Y-%m-%d') for r in records]
-    data = [1 if r.present else 0 for r in records]
+    labels = [day.strftime('%Y-%m-%d') for day, present in rows]
+    data = [1 if present else 0 for day, present in rows]
     
     return jsonify({
         'labels': labels,
@@ -470,14 +612,15 @@ def progress_chart_data():
     if current_user.role != 'student':
         return jsonify({'error': 'Unauthorized'}), 401
     
-    student = Student.query.filter_by(user_id=current_user.id).first()
+    student_id = current_user.profile_id
     
-    records = Progress.query.filter_by(student_id=student.id).order_by(
-        Progress.date
-    ).limit(10).all()
+    rows = db.session.execute(
+        PROGRESS_CHART_STMT,
+        {'student_id': student_id}
+    ).all()
     
-    labels = [r.assignment_name for r in records]
-    data = [r.percentage for r in records]
+    labels = [assignment_name for assignment_name, percentage in rows]
+    data = [percentage for assignment_name, percentage in rows]
     
     return jsonify({
         'labels': labels,
@@ -494,10 +637,87 @@ def server_error(error):
     db.session.rollback()
     return render_template('500.html'), 500
 
-# Database Initialization
-@app.before_request
-def create_tables():
-    db.create_all()
+# Database Initialization (once at import, also covers gunicorn/WSGI)
+# Rebuild a progress table created before percentage became a generated column (SQLite only)
+def upgrade_progress_table(conn):
+    # Checked only once the write lock is held, another worker may have upgraded already
+    columns = conn.exec_driver_sql('PRAGMA table_xinfo(progress)').all()
+    # hidden == 3 marks a STORED generated column
+    generated = any(col[1] == 'percentage' and col[6] == 3 for col in columns)
+    leftover = conn.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'progress_old'"
+    ).first()
+    
+    if columns and not generated:
+        if leftover:
+            raise RuntimeError('Both progress and progress_old exist with the old schema; '
+                               'merge them by hand before starting the app')
+        conn.exec_driver_sql('ALTER TABLE progress RENAME TO progress_old')
+    elif not leftover:
+        return
+    
+    if not generated:
+        conn.execute(CreateTable(Progress.__table__))
+    
+    names = [col.name for col in Progress.__table__.columns if col.name != 'percentage']
+    # A leftover progress_old may be partly copied already (or the new table may have
+    # gained rows since); identical rows are skipped, a clashing id is an error
+    same_row = ' AND '.join(f'p.{name} IS o.{name}' for name in names)
+    clashes = conn.exec_driver_sql(
+        f'SELECT COUNT(*) FROM progress_old o JOIN progress p ON p.id = o.id WHERE NOT ({same_row})'
+    ).scalar()
+    if clashes:
+        raise RuntimeError(f'{clashes} rows in progress_old clash with progress by id; '
+                           'merge them by hand before starting the app')
+    
+    columns_sql = ', '.join(names)
+    conn.exec_driver_sql(f'INSERT INTO progress ({columns_sql}) SELECT {columns_sql} FROM progress_old '
+                         f'WHERE id NOT IN (SELECT id FROM progress)')
+    # Dropping the old table also drops its indexes; create_schema() recreates them
+    conn.exec_driver_sql('DROP TABLE progress_old')
+
+def create_schema(conn):
+    db.metadata.create_all(conn)
+    # create_all() skips indexes on tables that already exist
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+def init_sqlite_schema():
+    # pysqlite only opens transactions before DML, so drive the transaction by hand:
+    # BEGIN IMMEDIATE makes the DDL atomic and serializes workers starting together
+    with db.engine.connect() as conn:
+        dbapi_conn = conn.connection.driver_connection
+        isolation_level = dbapi_conn.isolation_level
+        dbapi_conn.isolation_level = None
+        try:
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                upgrade_progress_table(conn)
+                create_schema(conn)
+                conn.exec_driver_sql('COMMIT')
+            except Exception:
+                conn.exec_driver_sql('ROLLBACK')
+                raise
+        finally:
+            dbapi_conn.isolation_level = isolation_level
+
+# WAL lets dashboards read while a teacher is writing; larger page cache avoids disk reads
+def set_sqlite_pragmas(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA cache_size=-20000')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.close()
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, 'connect', set_sqlite_pragmas)
+        init_sqlite_schema()
+    else:
+        with db.engine.begin() as conn:
+            create_schema(conn)
 
 # Admin Setup
 @app.route('/admin/setup', methods=['GET', 'POST'])
@@ -590,8 +810,5 @@ def admin_setup():
 
 # Run App
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-    
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
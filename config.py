@@ -4,9 +4,48 @@ Change COLLEGE_NAME, SECRET_KEY, etc. to match your college
 """
 
 import os
+import tempfile
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
+def load_secret_key():
+    """SECRET_KEY env var, else a random key persisted next to the database"""
+    if os.environ.get('SECRET_KEY'):
+        return os.environ['SECRET_KEY']
+    
+    path = os.path.join(BASE_DIR, '.secret_key')
+    for _ in range(5):
+        try:
+            with open(path) as f:
+                key = f.read().strip()
+        except FileNotFoundError:
+            key = None
+        
+        if key and len(key) >= 32:
+            return key
+        
+        # Write the key to a temp file first so .secret_key never exists half-written.
+        # link() fails if another worker created it first; then the loop reads theirs.
+        # replace() overwrites an empty or truncated key file.
+        fd, tmp_path = tempfile.mkstemp(dir=BASE_DIR, prefix='.secret_key.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(os.urandom(32).hex())
+                f.flush()
+                os.fsync(f.fileno())
+            if key is None:
+                try:
+                    os.link(tmp_path, path)
+                except FileExistsError:
+                    pass
+            else:
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    
+    raise RuntimeError(f'Could not read or create {path}')
+
 class Config:
     """Base configuration - works on Render too!"""
     
@@ -14,8 +53,12 @@ class Config:
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(BASE_DIR, 'attendance.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
-    # Security key (change this to random string!)
-    SECRET_KEY = 'your-secret-key-12345678901234567890'
+    # Security key - set SECRET_KEY in the environment for production
+    # (stable across restarts so remember-me cookies stay valid)
+    SECRET_KEY = load_secret_key()
+    
+    # Raise on unintended lazy loads (catches N+1 queries during development)
+    RAISE_ON_LAZY_LOAD = False
     
     # Session settings
     PERMANENT_SESSION_LIFETIME = 1800
@@ -25,9 +68,9 @@ class Config:
     UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static', 'uploads')
     
     # Twilio (for SMS notifications - optional)
-    TWILIO_ACCOUNT_SID = 'your-account-sid'
-    TWILIO_AUTH_TOKEN = 'your-auth-token'
-    TWILIO_PHONE_NUMBER = '+1234567890'
+    TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID', 'your-account-sid')
+    TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN', 'your-auth-token')
+    TWILIO_PHONE_NUMBER = os.environ.get('TWILIO_PHONE_NUMBER', '+1234567890')
     
     # College Info
     COLLEGE_NAME = "Your College Name"
@@ -35,8 +78,15 @@ class Config:
 
 class DevelopmentConfig(Config):
     DEBUG = True
+    RAISE_ON_LAZY_LOAD = True
 
 class ProductionConfig(Config):
     DEBUG = False
 
+# Selected with the APP_CONFIG environment variable (defaults to production)
+config_by_name = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig
+}
+
 config = DevelopmentConfig()